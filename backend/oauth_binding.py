@@ -33,12 +33,36 @@ Integration:
 """
 
 import os
+import sys
 import json
 import time
+import random
+import struct
+import itertools
+import asyncio
+import hashlib
 import httpx
-from typing import Optional, Dict, Any, Tuple
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import Optional, Dict, Any, Mapping, Sequence, Tuple
 from dataclasses import dataclass
 
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+try:
+    import h2  # noqa: F401 — enables httpx's HTTP/2 support
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
 
 # ============================================================================
 # Provider Configurations
@@ -48,9 +72,9 @@ from dataclasses import dataclass
 # pi-mono line 75: const DEFAULT_ANTIGRAVITY_VERSION = "1.15.8";
 DEFAULT_ANTIGRAVITY_VERSION = "1.15.8"
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class OAuthContext:
-    """Per-request OAuth context extracted from headers."""
+    """Per-request OAuth context extracted from headers. Immutable and hashable."""
     provider: str
     token: str
     project_id: Optional[str] = None
@@ -58,65 +82,56 @@ class OAuthContext:
     enterprise_url: Optional[str] = None
 
 
-def _antigravity_headers() -> Dict[str, str]:
-    """
-    Headers for the Antigravity sandbox endpoint.
-    
-    Source: pi-mono/packages/ai/src/providers/google-gemini-cli.ts
-           getAntigravityHeaders() at line 77
-    
-    Must match exactly:
-      User-Agent: "antigravity/{version} darwin/arm64"
-      X-Goog-Api-Client: "google-cloud-sdk vscode_cloudshelleditor/0.1"
-      Client-Metadata: JSON with ideType, platform, pluginType
-    """
-    version = os.getenv("PI_AI_ANTIGRAVITY_VERSION", DEFAULT_ANTIGRAVITY_VERSION)
-    return {
-        "User-Agent": f"antigravity/{version} darwin/arm64",
-        "X-Goog-Api-Client": "google-cloud-sdk vscode_cloudshelleditor/0.1",
-        "Client-Metadata": json.dumps({
-            "ideType": "IDE_UNSPECIFIED",
-            "platform": "PLATFORM_UNSPECIFIED",
-            "pluginType": "GEMINI",
-        }),
-    }
+# Provider header values are static for the lifetime of the process, so they
+# are built once at import rather than on every request.
+# PI_AI_ANTIGRAVITY_VERSION is read once here; restart to pick up a change.
+_ANTIGRAVITY_VERSION = os.getenv("PI_AI_ANTIGRAVITY_VERSION", DEFAULT_ANTIGRAVITY_VERSION)
 
+_CLIENT_METADATA_JSON = _dumps({
+    "ideType": "IDE_UNSPECIFIED",
+    "platform": "PLATFORM_UNSPECIFIED",
+    "pluginType": "GEMINI",
+}).decode()
 
-def _gemini_cli_headers() -> Dict[str, str]:
-    """
-    Headers for the Gemini CLI prod endpoint.
-    
-    Source: pi-mono/packages/ai/src/providers/google-gemini-cli.ts
-           GEMINI_CLI_HEADERS at line 64
-    
-    Must match exactly:
-      User-Agent: "google-cloud-sdk vscode_cloudshelleditor/0.1"
-      X-Goog-Api-Client: "gl-node/22.17.0"
-    """
-    return {
-        "User-Agent": "google-cloud-sdk vscode_cloudshelleditor/0.1",
-        "X-Goog-Api-Client": "gl-node/22.17.0",
-        "Client-Metadata": json.dumps({
-            "ideType": "IDE_UNSPECIFIED",
-            "platform": "PLATFORM_UNSPECIFIED",
-            "pluginType": "GEMINI",
-        }),
-    }
+# Headers for the Antigravity sandbox endpoint.
+#
+# Source: pi-mono/packages/ai/src/providers/google-gemini-cli.ts
+#        getAntigravityHeaders() at line 77
+#
+# Must match exactly:
+#   User-Agent: "antigravity/{version} darwin/arm64"
+#   X-Goog-Api-Client: "google-cloud-sdk vscode_cloudshelleditor/0.1"
+#   Client-Metadata: JSON with ideType, platform, pluginType
+_ANTIGRAVITY_HEADERS: Dict[str, str] = {
+    "User-Agent": f"antigravity/{_ANTIGRAVITY_VERSION} darwin/arm64",
+    "X-Goog-Api-Client": "google-cloud-sdk vscode_cloudshelleditor/0.1",
+    "Client-Metadata": _CLIENT_METADATA_JSON,
+}
 
+# Headers for the Gemini CLI prod endpoint.
+#
+# Source: pi-mono/packages/ai/src/providers/google-gemini-cli.ts
+#        GEMINI_CLI_HEADERS at line 64
+#
+# Must match exactly:
+#   User-Agent: "google-cloud-sdk vscode_cloudshelleditor/0.1"
+#   X-Goog-Api-Client: "gl-node/22.17.0"
+_GEMINI_CLI_HEADERS: Dict[str, str] = {
+    "User-Agent": "google-cloud-sdk vscode_cloudshelleditor/0.1",
+    "X-Goog-Api-Client": "gl-node/22.17.0",
+    "Client-Metadata": _CLIENT_METADATA_JSON,
+}
 
-def _copilot_headers() -> Dict[str, str]:
-    """
-    Headers for GitHub Copilot endpoint.
-    
-    Source: pi-mono/packages/ai/src/providers/github-copilot-headers.ts
-    """
-    return {
-        "User-Agent": "GitHubCopilotChat/0.35.0",
-        "Editor-Version": "vscode/1.107.0",
-        "Editor-Plugin-Version": "copilot-chat/0.35.0",
-        "Copilot-Integration-Id": "vscode-chat",
-        "Openai-Intent": "conversation-edits",
-    }
+# Headers for GitHub Copilot endpoint.
+#
+# Source: pi-mono/packages/ai/src/providers/github-copilot-headers.ts
+_COPILOT_HEADERS: Dict[str, str] = {
+    "User-Agent": "GitHubCopilotChat/0.35.0",
+    "Editor-Version": "vscode/1.107.0",
+    "Editor-Plugin-Version": "copilot-chat/0.35.0",
+    "Copilot-Integration-Id": "vscode-chat",
+    "Openai-Intent": "conversation-edits",
+}
 
 
 # Endpoint configuration per provider
@@ -129,7 +144,7 @@ PROVIDER_CONFIGS = {
             "https://cloudcode-pa.googleapis.com",
         ],
         "path": "/v1internal:streamGenerateContent",
-        "headers_fn": _antigravity_headers,
+        "headers": _ANTIGRAVITY_HEADERS,
         "body_wrapper": "cloud_code_assist",
         "auth_type": "bearer",
     },
@@ -137,39 +152,117 @@ PROVIDER_CONFIGS = {
         # pi-mono: [DEFAULT_ENDPOINT]
         "endpoints": ["https://cloudcode-pa.googleapis.com"],
         "path": "/v1internal:streamGenerateContent",
-        "headers_fn": _gemini_cli_headers,
+        "headers": _GEMINI_CLI_HEADERS,
         "body_wrapper": "cloud_code_assist",
         "auth_type": "bearer",
     },
     "github-copilot": {
         "endpoints": ["https://api.individual.githubcopilot.com"],
         "path": "/chat/completions",
-        "headers_fn": _copilot_headers,
+        "headers": _COPILOT_HEADERS,
         "body_wrapper": "openai",
         "auth_type": "bearer",
     },
     "anthropic": {
         "endpoints": ["https://api.anthropic.com"],
         "path": "/v1/messages",
-        "headers_fn": lambda: {},
+        "headers": {},
         "body_wrapper": "anthropic",
         "auth_type": "bearer",
     },
     "openai-codex": {
         "endpoints": ["https://api.openai.com"],
         "path": "/v1/chat/completions",
-        "headers_fn": lambda: {},
+        "headers": {},
         "body_wrapper": "openai",
         "auth_type": "bearer",
     },
 }
 
+# Provider IDs contain "-", so CPython does not intern the literals above.
+# The keys are interned here, and extract_oauth_context swaps a known incoming
+# header value for its canonical key, so per-request lookups resolve on an
+# identity check. Unknown client-supplied values are never interned.
+PROVIDER_CONFIGS = {sys.intern(k): v for k, v in PROVIDER_CONFIGS.items()}
+
+# Incoming provider ID → canonical interned key
+_PROVIDER_IDS: Dict[str, str] = {k: k for k in PROVIDER_CONFIGS}
+
+# Full request URLs per provider, in endpoint fallback order
+for _cfg in PROVIDER_CONFIGS.values():
+    _cfg["urls"] = tuple(f"{endpoint}{_cfg['path']}" for endpoint in _cfg["endpoints"])
+del _cfg
+
+
+# ============================================================================
+# Shared HTTP Client
+#
+# A single pooled client is reused across requests so TCP+TLS handshakes to
+# the provider gateways are paid once per connection, not once per call.
+# Auth headers are passed per request — never set as client defaults — so
+# tokens from different accounts cannot leak between requests.
+#
+# Failed connection attempts are retried by the transport itself; the retry
+# loop in _send_request only handles 429/5xx and endpoint fallback.
+# ============================================================================
+
+# Transport-level retries for failed connects (DNS, refused, TLS handshake)
+TRANSPORT_CONNECT_RETRIES = 1
+
+_CLIENT: Optional[httpx.AsyncClient] = None
+# Event loop the pooled connections belong to; they cannot be reused on another
+_CLIENT_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared AsyncClient for the running event loop, creating it if needed."""
+    global _CLIENT, _CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    if _CLIENT is None or _CLIENT.is_closed or _CLIENT_LOOP is not loop:
+        # A client left over from a previous loop is dropped, not closed:
+        # its connections are bound to that (usually already closed) loop.
+        # Pool and HTTP/2 settings belong to the transport; the client ignores
+        # its own limits/http2 arguments when a transport is given.
+        transport = httpx.AsyncHTTPTransport(
+            retries=TRANSPORT_CONNECT_RETRIES,
+            http2=HAS_H2,
+            limits=httpx.Limits(
+                max_keepalive_connections=32,
+                max_connections=64,
+                keepalive_expiry=60.0,
+            ),
+        )
+        _CLIENT = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(connect=10.0, read=180.0, write=30.0, pool=5.0),
+        )
+        _CLIENT_LOOP = loop
+    return _CLIENT
+
+
+async def close_clients() -> None:
+    """
+    Close the shared HTTP client. Wire this into the server's shutdown event:
+
+        app.add_event_handler("shutdown", close_clients)
+    """
+    global _CLIENT, _CLIENT_LOOP
+    if _CLIENT is not None:
+        if _CLIENT_LOOP is asyncio.get_running_loop():
+            await _CLIENT.aclose()
+        _CLIENT = None
+        _CLIENT_LOOP = None
+
 
 # ============================================================================
 # Request Header Extraction (per-request, no global state)
 # ============================================================================
 
-def extract_oauth_context(headers: Dict[str, str]) -> Optional[OAuthContext]:
+# Providers that encode projectId in the token as JSON
+JSON_TOKEN_PROVIDERS = frozenset(sys.intern(p) for p in ("google-antigravity", "google-gemini-cli"))
+
+
+def extract_oauth_context(headers: Mapping[str, str]) -> Optional[OAuthContext]:
     """
     Extract OAuth context from incoming request headers.
     Returns None if no OAuth headers present (fallback to env-based credentials).
@@ -178,29 +271,37 @@ def extract_oauth_context(headers: Dict[str, str]) -> Optional[OAuthContext]:
       - X-OAuth-Provider: provider ID (e.g., 'google-antigravity')
       - X-OAuth-Token: API key or JSON-encoded token
     
+    `headers` must look up keys case-insensitively (e.g. Starlette's
+    `request.headers`) or use lowercase keys. Pass `request.headers`
+    directly rather than copying it into a dict.
+    
     For Antigravity/Gemini CLI, the token is JSON: {"token": "...", "projectId": "..."}
     This matches the output of provider.getApiKey() in pi-mono's
     google-antigravity.ts and google-gemini-cli.ts.
     """
-    provider = headers.get("X-OAuth-Provider") or headers.get("x-oauth-provider")
-    token = headers.get("X-OAuth-Token") or headers.get("x-oauth-token")
+    provider = headers.get("x-oauth-provider")
+    token = headers.get("x-oauth-token")
     
     if not provider or not token:
         return None
     
+    provider = _PROVIDER_IDS.get(provider, provider)
+    
     project_id = None
     actual_token = token
     
     # Antigravity and Gemini CLI encode projectId in the token as JSON
     # Source: pi-mono google-antigravity.ts getApiKey():
     #   return JSON.stringify({ token: creds.access, projectId: creds.projectId });
-    if provider in ("google-antigravity", "google-gemini-cli"):
+    # A raw bearer token never starts with "{", so only JSON-shaped tokens are
+    # parsed; anything else is used as-is without raising and catching.
+    if provider in JSON_TOKEN_PROVIDERS and token.startswith("{"):
         try:
-            parsed = json.loads(token)
-            actual_token = parsed.get("token", token)
-            project_id = parsed.get("projectId")
-        except (json.JSONDecodeError, TypeError):
-            pass
+            parsed = _loads(token)
+        except ValueError:  # malformed JSON; orjson.JSONDecodeError subclasses ValueError
+            parsed = {}
+        actual_token = parsed.get("token", token)
+        project_id = parsed.get("projectId")
     
     return OAuthContext(
         provider=provider,
@@ -226,6 +327,27 @@ def extract_oauth_context(headers: Dict[str, str]) -> Optional[OAuthContext]:
 # }
 # ============================================================================
 
+# requestId prefix and userAgent, indexed by is_antigravity
+_REQUEST_ID_PREFIX = ("pi", "agent")
+_USER_AGENT = ("pi-coding-agent", "antigravity")
+
+# requestId suffixes only need to be unique, not unpredictable — a PRNG seeded
+# once from os.urandom avoids a getrandom syscall per request.
+_rng = random.Random(os.urandom(16))
+
+# requestId body: 8 bytes time_ns + 4 bytes counter + 4 random bytes, hex
+# encoded. Leading timestamp keeps IDs sortable by creation time for tracing.
+_REQUEST_ID_STRUCT = struct.Struct(">QII")
+_REQUEST_COUNTER = itertools.count()
+_time_ns = time.time_ns
+
+
+def _request_id(prefix: str) -> str:
+    counter = next(_REQUEST_COUNTER) & 0xFFFFFFFF
+    packed = _REQUEST_ID_STRUCT.pack(_time_ns(), counter, _rng.getrandbits(32))
+    return f"{prefix}-{packed.hex()}"
+
+
 def _wrap_cloud_code_assist(body: Dict[str, Any], ctx: OAuthContext, model: str) -> Dict[str, Any]:
     """
     Wrap request body in Cloud Code Assist envelope.
@@ -235,18 +357,18 @@ def _wrap_cloud_code_assist(body: Dict[str, Any], ctx: OAuthContext, model: str)
     Key constants from pi-mono:
       - requestType: "agent" for Antigravity, omitted for Gemini CLI
       - userAgent: "antigravity" for Antigravity, "pi-coding-agent" for Gemini CLI
-      - requestId: "{prefix}-{timestamp}-{random}" 
+      - requestId: "{prefix}-..." — pi-mono uses "{prefix}-{timestamp}-{random}";
+        the gateway treats it as opaque, so _request_id() packs the same
+        timestamp + randomness (plus a counter) into one hex string
     """
     is_antigravity = ctx.provider == "google-antigravity"
-    prefix = "agent" if is_antigravity else "pi"
-    random_suffix = os.urandom(5).hex()[:9]  # 9 chars to match Math.random().toString(36).slice(2, 11)
     
     envelope: Dict[str, Any] = {
         "project": ctx.project_id or "",
         "model": model,
         "request": body,
-        "userAgent": "antigravity" if is_antigravity else "pi-coding-agent",
-        "requestId": f"{prefix}-{int(time.time() * 1000)}-{random_suffix}",
+        "userAgent": _USER_AGENT[is_antigravity],
+        "requestId": _request_id(_REQUEST_ID_PREFIX[is_antigravity]),
     }
     
     # requestType is only set for Antigravity, not Gemini CLI
@@ -259,16 +381,23 @@ def _wrap_cloud_code_assist(body: Dict[str, Any], ctx: OAuthContext, model: str)
 
 def _build_auth_headers(ctx: OAuthContext, config: dict) -> Dict[str, str]:
     """Build authentication and provider-specific headers."""
-    headers = {
+    # Provider-specific headers (User-Agent, X-Goog-Api-Client, etc.) are
+    # precomputed; only the per-request token varies.
+    return {
+        **config["headers"],
         "Authorization": f"Bearer {ctx.token}",
         "Content-Type": "application/json",
     }
-    
-    # Add provider-specific headers (User-Agent, X-Goog-Api-Client, etc.)
-    provider_headers = config["headers_fn"]()
-    headers.update(provider_headers)
-    
-    return headers
+
+
+# pi-mono: BASE_DELAY_MS = 2000, doubled per attempt. Precomputed in seconds;
+# attempts beyond the table reuse the last (largest) delay.
+BASE_DELAY_MS = 2000
+_BACKOFF_S = tuple((BASE_DELAY_MS * (2 ** attempt)) / 1000 for attempt in range(8))
+
+
+def _backoff_delay(attempt: int) -> float:
+    return _BACKOFF_S[min(attempt, len(_BACKOFF_S) - 1)]
 
 
 # ============================================================================
@@ -277,47 +406,253 @@ def _build_auth_headers(ctx: OAuthContext, config: dict) -> Dict[str, str]:
 # isRetryableError() function
 # ============================================================================
 
-def _is_retryable_error(status_code: int, error_text: str) -> bool:
+# Error bodies are only kept up to this many bytes
+ERROR_TEXT_LIMIT = 500
+
+
+def _is_retryable_status(status_code: int) -> bool:
+    """Rate limits and server errors are retryable regardless of the body."""
+    return status_code == 429 or status_code >= 500
+
+
+def _is_retryable_error(status_code: int, error_head: bytes) -> bool:
     """Check if an error is retryable (rate limits, transient failures)."""
-    if status_code == 429:
-        return True
-    if status_code >= 500:
+    if _is_retryable_status(status_code):
         return True
     # Resource exhausted
-    if "RESOURCE_EXHAUSTED" in error_text.upper():
+    if b"RESOURCE_EXHAUSTED" in error_head.upper():
         return True
     return False
 
 
+async def _read_head(response: httpx.Response, limit: int) -> bytes:
+    """Read at most `limit` decoded bytes of a streamed body (e.g. an HTML 5xx page)."""
+    head = bytearray()
+    async with aclosing(response.aiter_bytes()) as chunks:
+        async for chunk in chunks:
+            head += chunk
+            if len(head) >= limit:
+                break
+    return bytes(head[:limit])
+
+
+# ============================================================================
+# Endpoint Health
+#
+# Endpoints that fail with a 5xx or a remote network error are put on an
+# exponential cooldown (capped at 60s) and tried after healthy ones until it
+# elapses, so a known-down Antigravity sandbox does not cost a round trip on
+# every request. Any response below 500 marks the endpoint healthy again.
+# ============================================================================
+
+ENDPOINT_COOLDOWN_MAX_S = 60.0
+
+# Network errors that say something about the remote endpoint. Local
+# conditions such as httpx.PoolTimeout (our own pool is exhausted) or
+# httpx.UnsupportedProtocol are deliberately excluded.
+_ENDPOINT_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.ReadError,
+    httpx.ReadTimeout,
+    httpx.WriteError,
+    httpx.WriteTimeout,
+    httpx.RemoteProtocolError,
+)
+
+# endpoint URL → {"fails": consecutive failures, "last_fail_ts", "cooldown_until"}
+_ENDPOINT_HEALTH: Dict[str, Dict[str, float]] = {}
+
+
+def _order_endpoints(urls: Sequence[str]) -> Sequence[str]:
+    """Endpoints still cooling down go last; otherwise keep configured order."""
+    if not _ENDPOINT_HEALTH:
+        return urls
+    now = time.monotonic()
+    return sorted(
+        urls,
+        key=lambda u: max(_ENDPOINT_HEALTH.get(u, {}).get("cooldown_until", 0.0) - now, 0.0),
+    )
+
+
+def _record_endpoint_failure(url: str) -> None:
+    health = _ENDPOINT_HEALTH.setdefault(url, {"fails": 0})
+    health["fails"] += 1
+    now = time.monotonic()
+    health["last_fail_ts"] = now
+    health["cooldown_until"] = now + min(ENDPOINT_COOLDOWN_MAX_S, 2 ** health["fails"])
+
+
+def _record_endpoint_success(url: str) -> None:
+    _ENDPOINT_HEALTH.pop(url, None)
+
+
+def reset_endpoint_health() -> None:
+    """Forget all endpoint failures (e.g. between tests)."""
+    _ENDPOINT_HEALTH.clear()
+
+
+# ============================================================================
+# Response Cache & Request Coalescing
+#
+# Non-streaming requests that explicitly set temperature to 0 are keyed by
+# a hash of provider, token, model and body; the token is included so
+# responses never cross accounts.
+#   - Concurrent identical requests share one upstream call (single-flight).
+#   - With cache_ttl > 0, successful responses are also reused for that long,
+#     e.g. the same extraction prompt re-run over an unchanged chunk.
+# ============================================================================
+
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+
+# key → (stored_at, status_code, serialized response_json), oldest first.
+# Responses are stored as bytes and decoded on every hit, so a caller that
+# mutates its result cannot corrupt later hits.
+_RESPONSE_CACHE: "OrderedDict[str, Tuple[float, int, bytes]]" = OrderedDict()
+
+# key → upstream call in progress, awaited by every concurrent duplicate.
+# Resolves to (status_code, response_json, serialized response_json).
+_INFLIGHT: Dict[str, "asyncio.Future[Tuple[int, Dict[str, Any], bytes]]"] = {}
+
+
+def _is_deterministic(body: Dict[str, Any]) -> bool:
+    """
+    True only if the body explicitly sets temperature to 0. Providers sample
+    at a default temperature near 1 when the field is absent.
+    """
+    temperature = body.get("temperature")
+    if temperature is None:
+        # Gemini nests sampling parameters under generationConfig
+        generation_config = body.get("generationConfig")
+        if isinstance(generation_config, dict):
+            temperature = generation_config.get("temperature")
+    return temperature == 0 and not isinstance(temperature, bool)
+
+
+def _request_key(ctx: OAuthContext, model: str, body: Dict[str, Any]) -> str:
+    # Hash the unwrapped body — the Cloud Code Assist envelope carries a
+    # unique requestId that would defeat caching.
+    material = _dumps([ctx.provider, ctx.token, ctx.project_id, model, body])
+    return hashlib.blake2b(material, digest_size=16).hexdigest()
+
+
+def _cache_get(key: str, ttl: float) -> Optional[Tuple[int, Dict[str, Any]]]:
+    entry = _RESPONSE_CACHE.get(key)
+    if entry is None:
+        return None
+    stored_at, status, encoded = entry
+    if time.monotonic() - stored_at >= ttl:
+        del _RESPONSE_CACHE[key]
+        return None
+    _RESPONSE_CACHE.move_to_end(key)
+    return status, _loads(encoded)
+
+
+def _cache_put(key: str, status: int, encoded: bytes) -> None:
+    _RESPONSE_CACHE[key] = (time.monotonic(), status, encoded)
+    _RESPONSE_CACHE.move_to_end(key)
+    while len(_RESPONSE_CACHE) > RESPONSE_CACHE_MAX_ENTRIES:
+        _RESPONSE_CACHE.popitem(last=False)
+
+
+async def _send_shared(
+    ctx: OAuthContext,
+    config: dict,
+    body: Dict[str, Any],
+    model: str,
+    max_retries: int,
+) -> Tuple[int, Dict[str, Any], bytes]:
+    """_send_request plus a serialized copy for callers joining the request."""
+    status, result = await _send_request(ctx, config, body, model, max_retries)
+    return status, result, _dumps(result)
+
+
+def clear_response_cache() -> None:
+    """Drop all cached responses."""
+    _RESPONSE_CACHE.clear()
+
+
 async def make_oauth_request(
     ctx: OAuthContext,
     body: Dict[str, Any],
     model: str = "",
     stream: bool = False,
     max_retries: int = 2,
-) -> Tuple[int, Dict[str, Any]]:
+    cache_ttl: float = 0.0,
+) -> Tuple[int, Any]:
     """
     Make an outbound API request using OAuth credentials.
     
     Implements the retry logic from pi-mono's streamGoogleGeminiCli():
-    - Try endpoints in order (Antigravity: daily sandbox first, then prod)
+    - Try endpoints in order (Antigravity: daily sandbox first, then prod),
+      moving endpoints that recently failed to the back
     - Retry on 429/5xx with exponential backoff
+    - On a failed connect (already retried by the transport), fall back to
+      the next endpoint without backoff
     - Return on any <500 response (including 401 for upstream handling)
     
     Args:
         ctx: Per-request OAuth context (from extract_oauth_context)
         body: Request body (standard LLM format)
         model: Model identifier
-        stream: Whether to use streaming
+        stream: Return the open httpx.Response on success instead of parsed
+            JSON. The caller iterates it (e.g. `aiter_lines()`) and must
+            `await response.aclose()` when done.
         max_retries: Maximum retry attempts (default 2, matching pi-mono MAX_RETRIES)
+        cache_ttl: Seconds to reuse a successful response for an identical
+            non-streaming request with an explicit temperature of 0
+            (default 0 = disabled).
+    
+    Identical non-streaming requests with an explicit temperature of 0
+    issued concurrently share a single upstream call. Every caller gets its
+    own result object: callers that joined the shared call and cache hits
+    decode a private copy.
     
     Returns:
-        Tuple of (status_code, response_json)
+        Tuple of (status_code, response_json), or (status_code, httpx.Response)
+        for a successful streaming request
     """
     config = PROVIDER_CONFIGS.get(ctx.provider)
     if not config:
         return 400, {"error": f"Unknown OAuth provider: {ctx.provider}"}
     
+    if stream or not _is_deterministic(body):
+        return await _send_request(ctx, config, body, model, max_retries, stream)
+    
+    key = _request_key(ctx, model, body)
+    if cache_ttl > 0:
+        cached = _cache_get(key, cache_ttl)
+        if cached is not None:
+            return cached
+    
+    inflight = _INFLIGHT.get(key)
+    started = inflight is None
+    if started:
+        # Run the upstream call as its own task so that cancelling the caller
+        # that started it does not cancel it for the callers sharing it.
+        inflight = asyncio.ensure_future(_send_shared(ctx, config, body, model, max_retries))
+        _INFLIGHT[key] = inflight
+        inflight.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    
+    status, result, encoded = await asyncio.shield(inflight)
+    if cache_ttl > 0 and status < 400:
+        _cache_put(key, status, encoded)
+    # Only the caller that started the request keeps the original object;
+    # joiners decode their own copy so no caller can mutate another's result.
+    if not started:
+        result = _loads(encoded)
+    return status, result
+
+
+async def _send_request(
+    ctx: OAuthContext,
+    config: dict,
+    body: Dict[str, Any],
+    model: str,
+    max_retries: int,
+    stream: bool = False,
+) -> Tuple[int, Any]:
+    """Send the request upstream, trying endpoints with retry and backoff."""
     headers = _build_auth_headers(ctx, config)
     
     # Wrap body if needed
@@ -327,56 +662,83 @@ async def make_oauth_request(
     
     # Try endpoints with retry logic
     # Source: pi-mono google-gemini-cli.ts lines 381-410
-    endpoints = config["endpoints"]
+    urls = _order_endpoints(config["urls"])
     last_error = None
-    base_delay_ms = 2000  # pi-mono: BASE_DELAY_MS = 2000
+    client = _get_client()
+    # Serialize once; Content-Type is already set by _build_auth_headers
+    payload = _dumps(request_body)
+    
+    attempts_made = 0
     
     for attempt in range(max_retries + 1):
-        endpoint = endpoints[min(attempt, len(endpoints) - 1)]
-        url = f"{endpoint}{config['path']}"
+        attempts_made += 1
+        url = urls[min(attempt, len(urls) - 1)]
         
         try:
-            async with httpx.AsyncClient(timeout=180.0) as client:
-                response = await client.post(
-                    url,
-                    headers=headers,
-                    json=request_body,
-                )
-                
-                if response.status_code < 400:
-                    # Success
-                    try:
-                        return response.status_code, response.json()
-                    except Exception:
-                        return response.status_code, {"response": response.text}
-                
-                error_text = response.text[:500]
-                
-                # Non-retryable errors (401, 403, 404, etc.) — return immediately
-                if not _is_retryable_error(response.status_code, error_text):
-                    try:
-                        return response.status_code, response.json()
-                    except Exception:
-                        return response.status_code, {"error": error_text}
-                
-                # Retryable error — exponential backoff
-                if attempt < max_retries:
-                    import asyncio
-                    delay_s = (base_delay_ms * (2 ** attempt)) / 1000
-                    await asyncio.sleep(delay_s)
-                    last_error = f"{response.status_code}: {error_text}"
-                    continue
-                
+            response = await client.send(
+                client.build_request("POST", url, headers=headers, content=payload),
+                stream=True,
+            )
+            
+            if response.status_code >= 500:
+                _record_endpoint_failure(url)
+            else:
+                _record_endpoint_success(url)
+            
+            if stream and response.status_code < 400:
+                # Hand the open response to the caller to iterate; no copy here
+                return response.status_code, response
+            
+            try:
+                if _is_retryable_status(response.status_code):
+                    # Only the head is needed for the error message
+                    content = await _read_head(response, ERROR_TEXT_LIMIT)
+                else:
+                    content = await response.aread()
+            finally:
+                await response.aclose()
+            
+            if response.status_code < 400:
+                # Success
+                try:
+                    return response.status_code, _loads(content)
+                except Exception:
+                    return response.status_code, {"response": response.text}
+            
+            error_head = content[:ERROR_TEXT_LIMIT]
+            error_text = error_head.decode("utf-8", "replace")
+            
+            # Non-retryable errors (401, 403, 404, etc.) — return immediately
+            if not _is_retryable_error(response.status_code, error_head):
+                try:
+                    return response.status_code, _loads(content)
+                except Exception:
+                    return response.status_code, {"error": error_text}
+            
+            # Retryable error — exponential backoff
+            if attempt < max_retries:
+                await asyncio.sleep(_backoff_delay(attempt))
                 last_error = f"{response.status_code}: {error_text}"
+                continue
+            
+            last_error = f"{response.status_code}: {error_text}"
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            # The transport already retried the connect — only fall back to
+            # a different endpoint, never back off and retry the same one.
+            last_error = str(e)
+            _record_endpoint_failure(url)
+            if attempt < max_retries and urls[min(attempt + 1, len(urls) - 1)] != url:
+                continue
+            break
         except Exception as e:
             last_error = str(e)
+            if isinstance(e, _ENDPOINT_ERRORS):
+                _record_endpoint_failure(url)
             if attempt < max_retries:
-                import asyncio
-                delay_s = (base_delay_ms * (2 ** attempt)) / 1000
-                await asyncio.sleep(delay_s)
+                await asyncio.sleep(_backoff_delay(attempt))
                 continue
     
-    return 502, {"error": f"All endpoints failed after {max_retries + 1} attempts. Last error: {last_error}"}
+    return 502, {"error": f"All endpoints failed after {attempts_made} attempts. Last error: {last_error}"}
 
 
 # ============================================================================
@@ -387,11 +749,14 @@ async def make_oauth_request(
 Usage in your LightRAG FastAPI server:
 
     from oauth_middleware import OAuthInjectionMiddleware
-    from oauth_binding import extract_oauth_context, make_oauth_request
+    from oauth_binding import extract_oauth_context, make_oauth_request, close_clients
 
     # Add middleware for automatic env var injection (Strategy B)
     app.add_middleware(OAuthInjectionMiddleware)
 
+    # Release pooled upstream connections on shutdown
+    app.add_event_handler("shutdown", close_clients)
+
     # For routes that make outbound LLM calls directly:
     @app.post("/query")
     async def query(request: Request, body: QueryRequest):
@@ -399,7 +764,7 @@ Usage in your LightRAG FastAPI server:
         # Just call LightRAG normally — the middleware already set the env vars.
         
         # Option B: Use oauth_binding for direct API dispatch
-        ctx = extract_oauth_context(dict(request.headers))
+        ctx = extract_oauth_context(request.headers)
         if ctx:
             status, result = await make_oauth_request(
                 ctx=ctx,
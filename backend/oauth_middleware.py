@@ -2,15 +2,15 @@
 Strategy B: Per-request OAuth token injection middleware for LightRAG.
 
 This middleware intercepts incoming requests from the Obsidian plugin,
-extracts X-OAuth-Provider and X-OAuth-Token headers, and temporarily
-overrides the process-level API key environment variables for the
-duration of that specific request.
+extracts X-OAuth-Provider and X-OAuth-Token headers, and overrides the
+API key environment variables as seen by that specific request.
 
 This eliminates the need for server restarts when OAuth tokens change
 (Strategy A), since every request carries its own fresh token.
 
 Integration:
-    from oauth_middleware import OAuthInjectionMiddleware
+    from oauth_middleware import OAuthInjectionMiddleware, patch_lightrag_env_reads
+    patch_lightrag_env_reads()
     app.add_middleware(OAuthInjectionMiddleware)
 
 How it works:
@@ -21,16 +21,27 @@ How it works:
        - github-copilot     → OPENAI_API_KEY
        - anthropic          → ANTHROPIC_API_KEY
        - openai-codex       → OPENAI_API_KEY
-  3. os.environ is patched for the request scope, then restored after
+  3. The overrides are stored in a contextvar for the request scope; the
+     process environment itself is never modified
+  4. get_effective_env() — or an os.environ key lookup once
+     patch_lightrag_env_reads() has run — returns the override for the
+     current request
 
 Provider mapping matches pi-mono's env-api-keys.ts precedence.
 Reference: pi-mono/packages/ai/src/env-api-keys.ts
 """
 
 import os
-import json
+import sys
 import contextvars
-from typing import Optional, Dict, Tuple
+from collections.abc import ItemsView, ValuesView
+from functools import partial
+from typing import Callable, Optional, Dict, Mapping, Tuple
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
 
 try:
     from starlette.middleware.base import BaseHTTPMiddleware
@@ -47,19 +58,26 @@ except ImportError:
 # Determines which os.environ key to override for each OAuth provider.
 # This must stay in sync with generateEnvConfig() in main.ts and
 # pi-mono/packages/ai/src/env-api-keys.ts.
+#
+# Keys are interned at import. _parse_oauth_headers() swaps a known incoming
+# provider header value for the canonical key, so later lookups match on
+# identity. Unknown client-supplied values are never interned.
 # ============================================================================
 
-PROVIDER_ENV_MAP: Dict[str, str] = {
+PROVIDER_ENV_MAP: Dict[str, str] = {sys.intern(k): v for k, v in {
     "google-antigravity": "GEMINI_API_KEY",
     "google-gemini-cli":  "GEMINI_API_KEY",
     "github-copilot":     "OPENAI_API_KEY",
     "anthropic":          "ANTHROPIC_API_KEY",
     "openai-codex":       "OPENAI_API_KEY",
-}
+}.items()}
 
 # Providers that encode projectId in the token as JSON
 # For these, we also set GOOGLE_CLOUD_PROJECT
-JSON_TOKEN_PROVIDERS = {"google-antigravity", "google-gemini-cli"}
+JSON_TOKEN_PROVIDERS = frozenset(sys.intern(p) for p in ("google-antigravity", "google-gemini-cli"))
+
+# Incoming provider ID → canonical interned key
+_PROVIDER_IDS: Dict[str, str] = {k: k for k in PROVIDER_ENV_MAP}
 
 
 # Context variable for per-request OAuth state (async-safe)
@@ -67,48 +85,72 @@ _oauth_env_overrides: contextvars.ContextVar[Optional[Dict[str, str]]] = \
     contextvars.ContextVar("_oauth_env_overrides", default=None)
 
 
-def _parse_oauth_headers(headers: Dict[str, str]) -> Optional[Tuple[str, str]]:
-    """Extract provider and token from request headers (case-insensitive)."""
-    provider = headers.get("x-oauth-provider") or headers.get("X-OAuth-Provider")
-    token = headers.get("x-oauth-token") or headers.get("X-OAuth-Token")
+def _parse_oauth_headers(headers: Mapping[str, str]) -> Optional[Tuple[str, str]]:
+    """
+    Extract provider and token from request headers.
+
+    Expects a case-insensitive mapping such as Starlette's `request.headers`
+    (or a dict with lowercase keys).
+    """
+    provider = headers.get("x-oauth-provider")
+    token = headers.get("x-oauth-token")
     if provider and token:
-        return provider, token
+        return _PROVIDER_IDS.get(provider, provider), token
     return None
 
 
-def _map_token_to_env(provider: str, raw_token: str) -> Dict[str, str]:
-    """
-    Map an OAuth token to the environment variables that LightRAG reads.
+def _parse_raw_token(env_key: str, raw_token: str) -> Dict[str, str]:
+    """The token is the API key as-is."""
+    return {env_key: raw_token}
 
-    For Google providers, the token is JSON-encoded: {"token": "...", "projectId": "..."}
+
+def _parse_google_token(env_key: str, raw_token: str) -> Dict[str, str]:
+    """
+    The token is JSON-encoded: {"token": "...", "projectId": "..."}
     We extract the raw access token for the API key env var and set
     GOOGLE_CLOUD_PROJECT separately.
-
-    Reference: pi-mono's getApiKey() in each OAuth provider module.
     """
-    env_key = PROVIDER_ENV_MAP.get(provider)
-    if not env_key:
-        return {}
+    overrides: Dict[str, str] = {env_key: raw_token}
 
-    overrides: Dict[str, str] = {}
-
-    if provider in JSON_TOKEN_PROVIDERS:
+    # A raw token never starts with "{" — only JSON-shaped tokens are parsed
+    if raw_token.startswith("{"):
         try:
-            parsed = json.loads(raw_token)
-            access_token = parsed.get("token", raw_token)
-            project_id = parsed.get("projectId", "")
-            overrides[env_key] = access_token
-            if project_id:
-                overrides["GOOGLE_CLOUD_PROJECT"] = project_id
-        except (json.JSONDecodeError, TypeError):
+            parsed = _loads(raw_token)
+        except ValueError:  # malformed JSON; orjson.JSONDecodeError subclasses ValueError
             # Not JSON — use raw token
-            overrides[env_key] = raw_token
-    else:
-        overrides[env_key] = raw_token
+            return overrides
+        overrides[env_key] = parsed.get("token", raw_token)
+        project_id = parsed.get("projectId", "")
+        if project_id:
+            overrides["GOOGLE_CLOUD_PROJECT"] = project_id
 
     return overrides
 
 
+# Provider → token parser, bound to that provider's env var
+_PROVIDER_PARSERS: Dict[str, Callable[[str], Dict[str, str]]] = {
+    provider: partial(
+        _parse_google_token if provider in JSON_TOKEN_PROVIDERS else _parse_raw_token,
+        env_key,
+    )
+    for provider, env_key in PROVIDER_ENV_MAP.items()
+}
+
+
+def _map_token_to_env(provider: str, raw_token: str) -> Dict[str, str]:
+    """
+    Map an OAuth token to the environment variables that LightRAG reads.
+
+    Returns {} for unknown providers.
+
+    Reference: pi-mono's getApiKey() in each OAuth provider module.
+    """
+    parser = _PROVIDER_PARSERS.get(provider)
+    if parser is None:
+        return {}
+    return parser(raw_token)
+
+
 def get_oauth_env_overrides() -> Optional[Dict[str, str]]:
     """
     Get the per-request OAuth environment overrides.
@@ -136,6 +178,95 @@ def get_effective_env(key: str, default: Optional[str] = None) -> Optional[str]:
     return os.environ.get(key, default)
 
 
+# Every env var _map_token_to_env() can override
+_OVERRIDABLE_ENV_KEYS = frozenset(PROVIDER_ENV_MAP.values()) | {"GOOGLE_CLOUD_PROJECT"}
+
+
+class _RealItemsView(ItemsView):
+    """items() of the real environment, ignoring per-request overrides."""
+
+    def __contains__(self, item):
+        key, value = item
+        try:
+            return os._Environ.__getitem__(self._mapping, key) == value
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        for key in self._mapping:
+            yield key, os._Environ.__getitem__(self._mapping, key)
+
+
+class _RealValuesView(ValuesView):
+    """values() of the real environment, ignoring per-request overrides."""
+
+    def __contains__(self, value):
+        return any(v == value for v in self)
+
+    def __iter__(self):
+        for key in self._mapping:
+            yield os._Environ.__getitem__(self._mapping, key)
+
+
+class _OAuthEnviron(os._Environ):
+    """
+    os.environ whose key lookups of _OVERRIDABLE_ENV_KEYS return the current
+    request's override first: os.environ[...], os.environ.get(), os.getenv()
+    and `in` all see it.
+
+    copy(), items() and values() read the real environment, so
+    subprocess.run(..., env=os.environ.copy()) does not hand the token to
+    the child. dict(os.environ) and {**os.environ} go through __getitem__
+    and DO include the override; build child environments with
+    os.environ.copy() instead.
+    """
+
+    def __getitem__(self, key):
+        if key in _OVERRIDABLE_ENV_KEYS:
+            overrides = _oauth_env_overrides.get()
+            if overrides and key in overrides:
+                return overrides[key]
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def items(self):
+        return _RealItemsView(self)
+
+    def values(self):
+        return _RealValuesView(self)
+
+    def copy(self):
+        return dict(self.items())
+
+
+def patch_lightrag_env_reads() -> None:
+    """
+    Make os.environ key lookups (os.environ[key], os.environ.get(),
+    os.getenv() and `key in os.environ`) honor per-request OAuth overrides
+    for the API key variables in PROVIDER_ENV_MAP.
+
+    Call once at startup, before LightRAG reads any credentials. This lets
+    LightRAG's existing os.environ["OPENAI_API_KEY"] and
+    os.environ.get("GEMINI_API_KEY") reads see the request's token without
+    modifying the process environment. Safe to call more than once.
+
+    Limitations:
+      - Overrides live in a contextvar. Code run through
+        loop.run_in_executor() does not inherit it and sees the real
+        environment; use asyncio.to_thread(), which copies the context.
+      - dict(os.environ) and {**os.environ} include the override (see
+        _OAuthEnviron); use os.environ.copy() for subprocess environments.
+    """
+    if not isinstance(os.environ, _OAuthEnviron):
+        os.environ.__class__ = _OAuthEnviron
+
+
 # ============================================================================
 # Starlette/FastAPI Middleware
 # ============================================================================
@@ -143,29 +274,28 @@ def get_effective_env(key: str, default: Optional[str] = None) -> Optional[str]:
 if HAS_STARLETTE:
     class OAuthInjectionMiddleware(BaseHTTPMiddleware):
         """
-        Middleware that injects OAuth tokens into os.environ for the request scope.
+        Middleware that scopes OAuth tokens to the request via a contextvar.
 
         For each incoming request with X-OAuth-Provider + X-OAuth-Token headers:
         1. Maps the token to the correct API key env var
-        2. Saves + overrides os.environ for the duration of the request
-        3. Restores original env vars after the request completes
+        2. Stores the overrides in a contextvar for the duration of the request
+        3. Resets the contextvar after the request completes
 
-        This makes LightRAG's existing os.environ.get("OPENAI_API_KEY") calls
-        transparently use the per-request OAuth token without any code changes
-        to LightRAG's core.
+        Combined with patch_lightrag_env_reads(), this makes LightRAG's
+        existing os.environ["OPENAI_API_KEY"] reads transparently use the
+        per-request OAuth token without any code changes to LightRAG's core.
 
-        Thread safety: Uses contextvars for async frameworks. The os.environ
-        patch is process-wide, so this is safe ONLY for single-request-at-a-time
-        deployments (which is the case for local Obsidian → localhost:9621).
-        For concurrent deployments, use get_effective_env() instead.
+        Thread safety: os.environ is never written, so concurrent requests
+        with different tokens cannot see each other's credentials.
         """
 
         async def dispatch(self, request: Request, call_next) -> Response:
-            headers = dict(request.headers)
-            parsed = _parse_oauth_headers(headers)
+            # Fast path: no OAuth headers — pass through, use env-based credentials
+            if "x-oauth-provider" not in request.headers:
+                return await call_next(request)
 
+            parsed = _parse_oauth_headers(request.headers)
             if not parsed:
-                # No OAuth headers — pass through, use env-based credentials
                 return await call_next(request)
 
             provider, raw_token = parsed
@@ -175,25 +305,14 @@ if HAS_STARLETTE:
                 # Unknown provider — pass through
                 return await call_next(request)
 
-            # Save original values and apply overrides
-            saved: Dict[str, Optional[str]] = {}
-            for key, value in overrides.items():
-                saved[key] = os.environ.get(key)
-                os.environ[key] = value
-
-            # Set contextvar for code that uses get_effective_env()
+            # Visible to get_effective_env() and the patched os.environ reads.
+            # call_next() runs the app in a task that copies this context, so
+            # the app (and its streamed response body) keeps seeing the
+            # overrides after the reset below. set() and reset() both happen
+            # in this coroutine, so the token always belongs to this context.
             token = _oauth_env_overrides.set(overrides)
 
             try:
-                response = await call_next(request)
-                return response
+                return await call_next(request)
             finally:
-                # Restore original environment
-                for key, original_value in saved.items():
-                    if original_value is None:
-                        os.environ.pop(key, None)
-                    else:
-                        os.environ[key] = original_value
-
-                # Reset contextvar
                 _oauth_env_overrides.reset(token)